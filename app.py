@@ -1,5 +1,12 @@
 import os
+import re
+import asyncio
+import logging
+import contextlib
 import uvicorn
+import jinja2
+import orjson
+from bson import ObjectId
 from datetime import datetime
 from urllib.parse import quote  # Import quote for URL safety
 from fastapi import (
@@ -18,32 +25,189 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette_session import SessionMiddleware
 from dotenv import load_dotenv
+from cachetools import TTLCache
+from pymongo.errors import PyMongoError
 
 import database
 
 # --- Initial Setup ---
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
-app = FastAPI()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A database that isn't ready yet shouldn't keep the site from serving;
+    # Motor connects again on its own once MongoDB is reachable.
+    try:
+        await database.prime_database()
+    except PyMongoError:
+        logger.exception("Failed to prime the database at startup")
+    known_emails_task = asyncio.create_task(
+        database.refresh_known_emails_periodically()
+    )
+    yield
+    known_emails_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await known_emails_task
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     SessionMiddleware, secret_key=SECRET_KEY, cookie_name="session_cookie"
 )
 
+# A form carries at most two files plus a few text fields.
+MAX_REQUEST_SIZE = 2 * database.MAX_UPLOAD_SIZE + 1024 * 1024
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Rejects request bodies larger than max_size with a 413. A declared
+    Content-Length is checked before any of the body is read; otherwise, as
+    with chunked uploads, the bytes are counted as they arrive and the request
+    is cut off as soon as the running total passes the limit.
+    """
+
+    def __init__(self, app, max_size: int):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_size:
+                    response = JSONResponse(
+                        {"detail": "Request body is too large."},
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    )
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    # Raised while the body is being parsed, before a response
+                    # has started, so FastAPI turns it into the 413 response.
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Request body is too large.",
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(RequestSizeLimitMiddleware, max_size=MAX_REQUEST_SIZE)
+
+# --- JSON Responses ---
+
+
+def orjson_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class MongoJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson, which encodes datetimes natively and
+    ObjectIds via orjson_default. Return it directly from the endpoint so
+    FastAPI's jsonable_encoder pass is skipped.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=orjson_default)
+
+
 # --- Static Files & Templates ---
 
 app.mount("/assets", StaticFiles(directory="assets"), name="assets")
 app.mount("/scripts", StaticFiles(directory="scripts"), name="scripts")
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-templates = Jinja2Templates(directory="pages")
+# Templates only change on deploy, so skip the per-render mtime check and keep
+# compiled bytecode in a filesystem cache shared across restarts and workers.
+jinja_env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader("pages"),
+    autoescape=True,
+    auto_reload=False,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(),
+)
+templates = Jinja2Templates(env=jinja_env)
+
+# Rendered HTML of public pages for anonymous visitors, keyed by the
+# template name and the rest of the template context.
+page_cache = TTLCache(maxsize=1024, ttl=60)
+
+
+def render_public_page(request: Request, name: str, user: dict | None, **context):
+    """
+    Renders a public page, serving anonymous visitors from the page cache.
+    Logged-in users always get a fresh render since the page shows their name.
+    """
+    if user:
+        return templates.TemplateResponse(
+            name, {"request": request, "user": user, **context}
+        )
+    key = (name, tuple(sorted(context.items())))
+    html = page_cache.get(key)
+    if html is None:
+        html = templates.get_template(name).render(
+            {"request": request, "user": None, **context}
+        )
+        page_cache[key] = html
+    return HTMLResponse(html)
+
 
 # --- Authentication & Protection Dependencies ---
 
 
+def session_user(user: dict) -> dict:
+    """The minimal user fields kept in the signed session cookie."""
+    return {"id": user["id"], "email": user["email"], "name": user["name"]}
+
+
 async def get_current_user(request: Request):
-    user_email = request.session.get("user_email")
-    if user_email:
+    # The session cookie is signed with SECRET_KEY, so the user stored in it
+    # can be trusted without going back to the database; only check that the
+    # user still exists.
+    user = request.session.get("user")
+    if user:
+        return user if await database.user_exists(user["email"]) else None
+    # Sessions created before the user was stored in the cookie only hold
+    # the email; look the user up once and upgrade the session.
+    if request.session.get("user_email"):
+        user = await get_current_user_fresh(request)
+        if user:
+            request.session["user"] = session_user(user)
+            return request.session["user"]
+    return None
+
+
+async def get_current_user_fresh(request: Request):
+    """Loads the live user document for routes that need more than the session holds."""
+    # Reuse the user already looked up earlier in this request, if any.
+    user = getattr(request.state, "user", None)
+    if user:
+        return user
+    user = request.session.get("user")
+    user_email = user["email"] if user else request.session.get("user_email")
+    if user_email and await database.user_exists(user_email):
         user = await database.get_user_by_email(user_email)
+        request.state.user = user
         return user
     return None
 
@@ -52,7 +216,10 @@ async def require_login(request: Request):
     user = await get_current_user(request)
     if not user:
         # FIX: Remember the page the user wanted to visit.
-        next_url = quote(str(request.url), safe="")
+        next_url = request.url.path
+        if request.url.query:
+            next_url += f"?{request.url.query}"
+        next_url = quote(next_url, safe="")
         redirect_url = f"/login?next={next_url}"
         raise HTTPException(
             status_code=status.HTTP_307_TEMPORARY_REDIRECT,
@@ -61,6 +228,23 @@ async def require_login(request: Request):
     return user
 
 
+# --- Form Helpers ---
+
+# A local path: one leading slash, not followed by another slash or backslash,
+# which browsers would treat as a protocol-relative URL to another host.
+LOCAL_PATH_PATTERN = re.compile(r"/(?![/\\])")
+
+
+def is_local_path(url: str | None) -> bool:
+    """Checks that a redirect target stays on this site."""
+    return bool(url and LOCAL_PATH_PATTERN.match(url))
+
+
+def split_comma_list(value: str) -> list[str]:
+    """Splits a comma-separated form value, dropping blank entries."""
+    return [item for item in map(str.strip, value.split(",")) if item]
+
+
 # --- User Login & Logout Endpoints ---
 
 
@@ -80,12 +264,12 @@ async def handle_login(
     is_password_correct = await database.verify_password(password, user["password"])
 
     if is_password_correct:
-        request.session["user_email"] = user["email"]
-        request.session["user_name"] = user["name"]
+        await database.rehash_password_if_needed(email, password, user["password"])
+        request.session["user"] = session_user(user)
 
         # FIX: Redirect to the intended page, or a default.
         # Check if next_url is a valid path to prevent open redirect vulnerabilities
-        if next_url and next_url.startswith("/"):
+        if is_local_path(next_url):
             return RedirectResponse(url=next_url, status_code=status.HTTP_303_SEE_OTHER)
         # Default redirect if next_url is not provided or invalid
         return RedirectResponse(
@@ -94,7 +278,7 @@ async def handle_login(
 
     # Add the next_url back to the query params on failed login attempt
     error_redirect_url = f"/login?error=1"
-    if next_url and next_url.startswith("/"):
+    if is_local_path(next_url):
         error_redirect_url += f"&next={quote(next_url)}"
     return RedirectResponse(
         url=error_redirect_url, status_code=status.HTTP_303_SEE_OTHER
@@ -112,24 +296,24 @@ async def handle_logout(request: Request):
 # =================================================================
 
 
-@app.get("/api/projects", response_class=JSONResponse)
+@app.get("/api/projects", response_class=MongoJSONResponse)
 async def get_projects():
-    return await database.get_all_projects()
+    return MongoJSONResponse(await database.get_all_projects())
 
 
-@app.get("/api/members", response_class=JSONResponse)
+@app.get("/api/members", response_class=MongoJSONResponse)
 async def get_members():
-    return await database.get_all_members()
+    return MongoJSONResponse(await database.get_all_members())
 
 
-@app.get("/api/gallery", response_class=JSONResponse)
+@app.get("/api/gallery", response_class=MongoJSONResponse)
 async def get_gallery():
-    return await database.get_all_gallery_items()
+    return MongoJSONResponse(await database.get_all_gallery_items())
 
 
-@app.get("/api/blogs", response_class=JSONResponse)
+@app.get("/api/blogs", response_class=MongoJSONResponse)
 async def get_blogs():
-    return await database.get_all_blogs()
+    return MongoJSONResponse(await database.get_all_blogs())
 
 
 # =================================================================
@@ -150,7 +334,7 @@ async def create_project(
     project_data = {
         "title": projectTitle,
         "description": projectDescription,
-        "techStack": [tech.strip() for tech in techStack.split(",")],
+        "techStack": split_comma_list(techStack),
         "github": githubLink,
         "linkedin": linkedinLink,
     }
@@ -217,7 +401,7 @@ async def create_blog(
         "category": category,
         "author": author,
         "readTime": f"{readTime} min read",
-        "tags": [tag.strip() for tag in tags.split(",")],
+        "tags": split_comma_list(tags),
     }
     return await database.add_blog(blog_data, image)
 
@@ -229,22 +413,23 @@ async def create_blog(
 
 @app.get("/", response_class=HTMLResponse)
 async def serve_home(request: Request):
-    user = await get_current_user(request)
-
-    projects = await database.get_all_projects()
-    members = await database.get_all_members()
+    user, project_count, member_count = await asyncio.gather(
+        get_current_user(request),
+        database.get_project_count(),
+        database.get_member_count(),
+    )
 
     start_date = datetime(2025, 1, 21)
     days_count = (datetime.now() - start_date).days
 
-    context = {
-        "request": request,
-        "user": user,
-        "project_count": len(projects),
-        "member_count": len(members),
-        "days_count": max(0, days_count),
-    }
-    return templates.TemplateResponse("index.html", context)
+    return render_public_page(
+        request,
+        "index.html",
+        user,
+        project_count=project_count,
+        member_count=member_count,
+        days_count=max(0, days_count),
+    )
 
 
 @app.get("/login", response_class=HTMLResponse)
@@ -264,31 +449,25 @@ async def serve_login(request: Request, next: str | None = Query(None)):
 @app.get("/projects", response_class=HTMLResponse)
 async def serve_projects_page(request: Request):
     user = await get_current_user(request)
-    return templates.TemplateResponse(
-        "projects.html", {"request": request, "user": user}
-    )
+    return render_public_page(request, "projects.html", user)
 
 
 @app.get("/members", response_class=HTMLResponse)
 async def serve_members_page(request: Request):
     user = await get_current_user(request)
-    return templates.TemplateResponse(
-        "members.html", {"request": request, "user": user}
-    )
+    return render_public_page(request, "members.html", user)
 
 
 @app.get("/gallery", response_class=HTMLResponse)
 async def serve_gallery_page(request: Request):
     user = await get_current_user(request)
-    return templates.TemplateResponse(
-        "gallery.html", {"request": request, "user": user}
-    )
+    return render_public_page(request, "gallery.html", user)
 
 
 @app.get("/blogs", response_class=HTMLResponse)
 async def serve_blogs_page(request: Request):
     user = await get_current_user(request)
-    return templates.TemplateResponse("blogs.html", {"request": request, "user": user})
+    return render_public_page(request, "blogs.html", user)
 
 
 # =================================================================
@@ -322,3 +501,20 @@ async def serve_add_blog_page(request: Request, user: dict = Depends(require_log
     return templates.TemplateResponse(
         "addblog.html", {"request": request, "user": user}
     )
+
+
+# --- Entrypoint ---
+
+if __name__ == "__main__":
+    # Each worker is a separate process with its own event loop, caches and
+    # MongoDB pool; the workers read WEB_CONCURRENCY to size their pools.
+    workers = int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "app:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+    )
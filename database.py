@@ -1,26 +1,76 @@
 import os
-import uuid
-from datetime import datetime
+import secrets
+import asyncio
+import logging
+from datetime import datetime, timezone
 import motor.motor_asyncio
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException, status
 import aiofiles
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from passlib.context import CryptContext
+from pymongo.errors import (
+    BulkWriteError,
+    DuplicateKeyError,
+    OperationFailure,
+    WriteError,
+)
 from fastapi.concurrency import run_in_threadpool
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 load_dotenv()
 MONGO_CONNECTION_STRING = os.environ["MONGO_CONNECTION_STRING"]
 DATABASE_NAME = "website"
 UPLOAD_DIR = "uploads"
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+SMALL_UPLOAD_SIZE = 2 * 1024 * 1024
+# Accepted upload types, mapped to the extension the file is stored with.
+# Only raster images are allowed: uploads are served from this site, so an
+# SVG (or anything saved with an .svg or .html name) could carry scripts.
+IMAGE_TYPES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+RESUME_TYPES = {
+    "application/pdf": ".pdf",
+    "application/msword": ".doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+}
+# Every worker process opens its own pool, so the MONGO_MAX_CONNECTIONS budget
+# is split across the WEB_CONCURRENCY workers, up to 50 per process.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+MONGO_MAX_CONNECTIONS = int(os.getenv("MONGO_MAX_CONNECTIONS", "100"))
+MONGO_MAX_POOL_SIZE = max(2, min(50, MONGO_MAX_CONNECTIONS // WEB_CONCURRENCY))
+MONGO_MIN_POOL_SIZE = max(1, MONGO_MAX_POOL_SIZE // 5)
+KNOWN_EMAILS_REFRESH_SECONDS = 30
 
 # --- Password Hashing Setup ---
-# Using bcrypt, a secure and widely-used hashing algorithm
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# New hashes use argon2id; existing bcrypt hashes still verify and are
+# upgraded to argon2id on the next successful login.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+)
 
 # --- Database Connection ---
-# Using motor for asynchronous access to MongoDB
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_CONNECTION_STRING)
+# Using motor for asynchronous access to MongoDB, with a bounded pool so a
+# burst of requests waits a limited time for a connection instead of stalling.
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    MONGO_CONNECTION_STRING,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=2000,
+    serverSelectionTimeoutMS=3000,
+)
 db = client[DATABASE_NAME]
 
 # Getting collections from the database
@@ -30,6 +80,67 @@ gallery_collection = db.get_collection("gallery")
 blogs_collection = db.get_collection("blogs")
 users_collection = db.get_collection("users")
 
+# --- Caching ---
+# Short-lived cache of user documents keyed by email, so repeated lookups
+# for the same session don't each cost a round-trip to MongoDB.
+user_cache = TTLCache(maxsize=1024, ttl=30)
+# Document counts shown on the home page, keyed by collection name.
+count_cache = TTLCache(maxsize=16, ttl=60)
+# Emails of all users, refreshed in the background, so sessions of existing
+# users can be accepted without a lookup.
+known_emails: set[str] = set()
+# Emails recently found to have no user, so sessions for deleted users don't
+# each cost a lookup either.
+missing_email_cache = TTLCache(maxsize=4096, ttl=KNOWN_EMAILS_REFRESH_SECONDS)
+
+# Only the fields needed for authentication and display are loaded for users.
+USER_PROJECTION = {"email": 1, "name": 1, "password": 1}
+# The public listings leave out fields their pages never use; members'
+# emails in particular shouldn't be published.
+LISTING_PROJECTION = {"createdAt": 0}
+MEMBER_PROJECTION = {"email": 0, "createdAt": 0}
+
+
+async def create_indexes():
+    """
+    Ensures the indexes used by email lookups exist.
+    Safe to call on every startup; MongoDB skips indexes that already exist.
+    An index that can't be built, such as the unique users index while the
+    collection still holds duplicate emails, is logged and skipped.
+    """
+    for collection, options in (
+        (users_collection, {"unique": True}),
+        (members_collection, {}),
+    ):
+        try:
+            await collection.create_index("email", **options)
+        except OperationFailure:
+            logger.exception("Failed to create the email index on %s", collection.name)
+
+
+async def prime_database():
+    """
+    Does the one-off MongoDB work at startup so the first requests after a
+    deploy don't pay for it: the first ping completes the TLS and auth
+    handshake, then the pool is filled, every collection is touched and the
+    indexes are ensured, all concurrently.
+    """
+    await db.command("ping")
+    await asyncio.gather(
+        create_indexes(),
+        *(db.command("ping") for _ in range(MONGO_MIN_POOL_SIZE)),
+        *(
+            collection.find_one({}, projection={"_id": 1})
+            for collection in (
+                projects_collection,
+                members_collection,
+                gallery_collection,
+                blogs_collection,
+                users_collection,
+            )
+        ),
+    )
+
 
 # --- Security Helper Functions (Fully Async) ---
 
@@ -48,24 +159,161 @@ async def get_password_hash(password: str) -> str:
     return await run_in_threadpool(pwd_context.hash, password)
 
 
+async def rehash_password_if_needed(
+    email: str, plain_password: str, hashed_password: str
+):
+    """
+    Re-hashes a verified password with the current scheme if its stored hash
+    uses a deprecated scheme or outdated parameters.
+    """
+    if not pwd_context.needs_update(hashed_password):
+        return
+    new_hash = await get_password_hash(plain_password)
+    await users_collection.update_one(
+        {"email": email}, {"$set": {"password": new_hash}}
+    )
+    user_cache.pop(email, None)
+
+
+# --- Write Batching ---
+
+
+class InsertBatcher:
+    """
+    Coalesces concurrent inserts into one collection into a single insert_many.
+    Each insert waits at most max_delay seconds for others to join its batch.
+    """
+
+    def __init__(self, collection, max_batch_size: int = 16, max_delay: float = 0.005):
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    async def insert(self, doc: dict):
+        loop = asyncio.get_running_loop()
+        # The worker is started lazily because it must run on the server's loop.
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        future = loop.create_future()
+        await self._queue.put((doc, future))
+        await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Unordered, so one bad document doesn't stop the rest of the batch
+            # from being written; only its own caller sees the error.
+            errors = {}
+            try:
+                await self.collection.insert_many(
+                    [doc for doc, _ in batch], ordered=False
+                )
+            except BulkWriteError as exc:
+                for error in exc.details.get("writeErrors", []):
+                    errors[error["index"]] = WriteError(
+                        error.get("errmsg"), error.get("code"), error
+                    )
+            except Exception as exc:
+                # Nothing is known about which documents were written.
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if index in errors:
+                    future.set_exception(errors[index])
+                else:
+                    future.set_result(None)
+
+
+projects_batcher = InsertBatcher(projects_collection)
+members_batcher = InsertBatcher(members_collection)
+gallery_batcher = InsertBatcher(gallery_collection)
+blogs_batcher = InsertBatcher(blogs_collection)
+
+
 # --- General Helper Functions ---
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
-async def save_upload_file(upload_file: UploadFile) -> str | None:
+def write_bytes(file_path: str, data: bytes):
+    with open(file_path, "wb") as out_file:
+        out_file.write(data)
+
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Uploaded files must be at most {MAX_UPLOAD_SIZE // (1024 * 1024)} MB.",
+    )
+
+
+def validate_upload_file(
+    upload_file: UploadFile | None, allowed_types: dict[str, str] = IMAGE_TYPES
+):
     """
-    Saves an uploaded file to the UPLOAD_DIR with a unique hex name.
+    Raises a 415 or 413 HTTPException if an uploaded file has a type that is
+    not allowed or is too large. Missing files are left for the caller.
+    """
+    if not upload_file or not upload_file.filename:
+        return
+    if upload_file.content_type not in allowed_types:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported file type: {upload_file.content_type}",
+        )
+    # The multipart parser has already spooled the whole file, so its size
+    # is known before anything is written to UPLOAD_DIR.
+    if upload_file.size > MAX_UPLOAD_SIZE:
+        raise upload_too_large()
+
+
+async def save_upload_file(
+    upload_file: UploadFile, allowed_types: dict[str, str] = IMAGE_TYPES
+) -> str | None:
+    """
+    Saves an uploaded file to the UPLOAD_DIR with a unique hex name and the
+    extension of its content type, ignoring the client's file name.
+    The type and size are checked before anything is written. Small files are
+    written in one go; larger ones are streamed in chunks so memory use stays
+    constant.
     Returns the web-accessible path to the saved file.
     """
     if not upload_file or not upload_file.filename:
         return None
-    file_extension = os.path.splitext(upload_file.filename)[1]
-    unique_filename = f"{uuid.uuid4().hex}{file_extension}"
+    validate_upload_file(upload_file, allowed_types)
+
+    file_extension = allowed_types[upload_file.content_type]
+    unique_filename = f"{secrets.token_hex(16)}{file_extension}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
 
-    async with aiofiles.open(file_path, "wb") as out_file:
-        content = await upload_file.read()
-        await out_file.write(content)
+    if upload_file.size <= SMALL_UPLOAD_SIZE:
+        # Small files are read whole and written with a single threadpool hop
+        # instead of one per chunk through aiofiles.
+        await run_in_threadpool(write_bytes, file_path, await upload_file.read())
+    else:
+        async with aiofiles.open(file_path, "wb") as out_file:
+            while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                await out_file.write(chunk)
 
     return f"/{UPLOAD_DIR}/{unique_filename}"
 
@@ -85,47 +333,100 @@ def mongo_id_serializer(doc: dict) -> dict:
 
 
 async def get_user_by_email(email: str) -> dict | None:
-    """Finds a user by their email address."""
-    user = await users_collection.find_one({"email": email})
+    """Finds a user by their email address, serving from the cache when possible."""
+    user = user_cache.get(email)
+    if user:
+        return user
+    user = await users_collection.find_one({"email": email}, projection=USER_PROJECTION)
     if user:
-        return mongo_id_serializer(user)
+        user = mongo_id_serializer(user)
+        user_cache[email] = user
+        return user
     return None
 
 
+async def user_exists(email: str) -> bool:
+    """
+    Checks whether a user with this email exists, using the in-memory
+    email caches first and MongoDB only for emails neither cache knows.
+    """
+    if email in known_emails:
+        return True
+    if email in missing_email_cache:
+        return False
+    if await get_user_by_email(email):
+        known_emails.add(email)
+        return True
+    missing_email_cache[email] = True
+    return False
+
+
+async def refresh_known_emails():
+    """Replaces the known email set with the emails currently in MongoDB."""
+    global known_emails
+    known_emails = set(await users_collection.distinct("email"))
+    missing_email_cache.clear()
+
+
+async def refresh_known_emails_periodically():
+    """Background task keeping known_emails in step with the users collection."""
+    while True:
+        try:
+            await refresh_known_emails()
+        except Exception:
+            logger.exception("Failed to refresh known user emails")
+        await asyncio.sleep(KNOWN_EMAILS_REFRESH_SECONDS)
+
+
+async def get_collection_count(collection) -> int:
+    """Returns a collection's estimated document count, cached for a minute."""
+    count = count_cache.get(collection.name)
+    if count is None:
+        count = await collection.estimated_document_count()
+        count_cache[collection.name] = count
+    return count
+
+
+async def get_project_count() -> int:
+    return await get_collection_count(projects_collection)
+
+
+async def get_member_count() -> int:
+    return await get_collection_count(members_collection)
+
+
 async def get_all_projects() -> list:
-    projects = []
-    async for project in projects_collection.find():
-        projects.append(mongo_id_serializer(project))
-    return projects
+    projects = await projects_collection.find(projection=LISTING_PROJECTION).to_list(
+        length=None
+    )
+    return [mongo_id_serializer(project) for project in projects]
 
 
 async def get_all_members() -> list:
-    members = []
-    async for member in members_collection.find():
-        members.append(mongo_id_serializer(member))
-    return members
+    members = await members_collection.find(projection=MEMBER_PROJECTION).to_list(
+        length=None
+    )
+    return [mongo_id_serializer(member) for member in members]
 
 
 async def get_all_users() -> list:
-    """Retrieves all documents from the users collection."""
-    users = []
-    async for user in users_collection.find():
-        users.append(mongo_id_serializer(user))
-    return users
+    """Retrieves all documents from the users collection, without password hashes."""
+    users = await users_collection.find(projection={"password": 0}).to_list(length=None)
+    return [mongo_id_serializer(user) for user in users]
 
 
 async def get_all_gallery_items() -> list:
-    gallery_items = []
-    async for item in gallery_collection.find():
-        gallery_items.append(mongo_id_serializer(item))
-    return gallery_items
+    gallery_items = await gallery_collection.find(
+        projection=LISTING_PROJECTION
+    ).to_list(length=None)
+    return [mongo_id_serializer(item) for item in gallery_items]
 
 
 async def get_all_blogs() -> list:
-    blogs = []
-    async for blog in blogs_collection.find():
-        blogs.append(mongo_id_serializer(blog))
-    return blogs
+    blogs = await blogs_collection.find(projection=LISTING_PROJECTION).to_list(
+        length=None
+    )
+    return [mongo_id_serializer(blog) for blog in blogs]
 
 
 # --- ADD (Create) Operations ---
@@ -136,8 +437,9 @@ async def add_project(project_data: dict, image_file: UploadFile) -> dict:
     if image_url:
         project_data["imageUrl"] = image_url
 
-    project_data["createdAt"] = datetime.utcnow()
-    await projects_collection.insert_one(project_data)
+    project_data["createdAt"] = datetime.now(timezone.utc)
+    await projects_batcher.insert(project_data)
+    count_cache.pop(projects_collection.name, None)
     return {"status": "success", "message": "Project added successfully"}
 
 
@@ -152,6 +454,8 @@ async def add_member(
     name = member_data.get("name")
     email = member_data.get("email")
     password = member_data.get("password")
+    # The member and its user record share one creation time.
+    created_at = datetime.now(timezone.utc)
 
     member_doc = {
         "name": name,
@@ -159,15 +463,20 @@ async def add_member(
         "linkedin": member_data.get("linkedin"),
         "github": member_data.get("github"),
         "email": email,
-        "createdAt": datetime.utcnow(),
+        "createdAt": created_at,
     }
 
+    # Check both files first so a rejected resume doesn't leave the photo
+    # behind in UPLOAD_DIR.
+    validate_upload_file(photo_file)
+    validate_upload_file(resume_file, RESUME_TYPES)
     if photo_file:
         member_doc["photoUrl"] = await save_upload_file(photo_file)
     if resume_file:
-        member_doc["resumeUrl"] = await save_upload_file(resume_file)
+        member_doc["resumeUrl"] = await save_upload_file(resume_file, RESUME_TYPES)
 
-    await members_collection.insert_one(member_doc)
+    await members_batcher.insert(member_doc)
+    count_cache.pop(members_collection.name, None)
 
     if is_admin:
         if not all([name, email, password]):
@@ -189,9 +498,18 @@ async def add_member(
             "name": name,
             "email": email,
             "password": hashed_password,
-            "createdAt": datetime.utcnow(),
+            "createdAt": created_at,
         }
-        await users_collection.insert_one(user_doc)
+        try:
+            await users_collection.insert_one(user_doc)
+        except DuplicateKeyError:
+            return {
+                "status": "error",
+                "message": "A user with this email already exists.",
+            }
+        user_cache.pop(email, None)
+        known_emails.add(email)
+        missing_email_cache.pop(email, None)
         return {
             "status": "success",
             "message": "Admin member and user created successfully",
@@ -205,8 +523,8 @@ async def add_gallery_item(gallery_data: dict, image_file: UploadFile) -> dict:
     if image_url:
         gallery_data["imageUrl"] = image_url
 
-    gallery_data["createdAt"] = datetime.utcnow()
-    await gallery_collection.insert_one(gallery_data)
+    gallery_data["createdAt"] = datetime.now(timezone.utc)
+    await gallery_batcher.insert(gallery_data)
     return {"status": "success", "message": "Gallery item added successfully"}
 
 
@@ -215,6 +533,6 @@ async def add_blog(blog_data: dict, image_file: UploadFile) -> dict:
     if image_url:
         blog_data["imageUrl"] = image_url
 
-    blog_data["createdAt"] = datetime.utcnow()
-    await blogs_collection.insert_one(blog_data)
+    blog_data["createdAt"] = datetime.now(timezone.utc)
+    await blogs_batcher.insert(blog_data)
     return {"status": "success", "message": "Blog post added successfully"}